@@ -1,17 +1,30 @@
+import asyncio
+import io
 import os
+import re
 import json
 import logging
+import time
+from collections import OrderedDict
 from contextlib import asynccontextmanager
-from typing import Any, AsyncIterator, Dict, List, Optional
-from datetime import datetime
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 import hashlib
 import uuid
 
+import httpx
+import orjson
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
-from supabase import Client, create_client
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
 from postgrest import APIError
 
+if TYPE_CHECKING:
+    # Imported lazily in lifespan(); only needed when DATABASE_URL is set
+    import asyncpg
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -19,14 +32,228 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Security configuration
-ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY")  # Optional additional security layer
-ENVIRONMENT = os.environ.get("ENVIRONMENT", "development")  # production, staging, development
-REQUIRE_CONFIRMATION = os.environ.get("REQUIRE_CONFIRMATION", "true").lower() == "true"
+# Security configuration, read once at import and bundled so hot paths bind one local
+_CONFIG = SimpleNamespace(
+    admin_key=os.environ.get("ADMIN_API_KEY"),  # Optional additional security layer
+    env=os.environ.get("ENVIRONMENT", "development"),  # production, staging, development
+    require_confirm=os.environ.get("REQUIRE_CONFIRMATION", "true").lower() == "true",
+    audit=os.environ.get("AUDIT_TRAIL_LEVEL", "on").lower() != "off",  # on, off
+    # Operations that need confirm='yes' in production
+    destructive_ops=frozenset({"apply_migration", "rollback_migration", "execute_sql_info"}),
+)
+
+# Rows per multi-row INSERT statement in PostgREST-based backups
+BACKUP_INSERT_BATCH_SIZE = 1000
+
+# Rows fetched per PostgREST request when paging through a table for backup
+BACKUP_PAGE_SIZE = 10_000
+
+# get_schema() results keyed by table name (None = all tables), least recently used first
+SCHEMA_CACHE_SIZE = 256
+_SCHEMA_CACHE: "OrderedDict[Optional[str], List[Dict[str, Any]]]" = OrderedDict()
+
+# Audit entries are queued by log_operation() and written in batches by a background task
+AUDIT_QUEUE_SIZE = 10_000
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 1.0  # seconds
+
+# create_migration inserts arriving within this window share one PostgREST request
+MIGRATION_BUFFER_INTERVAL = 0.05  # seconds
+MIGRATION_BUFFER_SIZE = 50
+
+# Read-only helper functions installed by security_setup.sql
+_HELPER_FUNCTIONS = ("check_rls_status", "get_table_security_info", "describe_table_secure", "get_all_schemas_secure")
+
+@dataclass(slots=True, frozen=True)
+class AppContext:
+    """
+    Resources created by lifespan() and shared by every tool call in its session.
+    """
+    supabase: AsyncClient
+    # Optional direct Postgres pool (DATABASE_URL) for COPY and transactional migrations
+    pg_pool: Optional["asyncpg.Pool"]
+    # Whether the helper functions exist, probed over DATABASE_URL (None = unknown)
+    has_helper_functions: Optional[bool]
+    # Whether migration_audit_log (security_setup.sql) exists, probed over DATABASE_URL
+    has_migration_audit_log: bool
+    # Pending audit entries, drained by _audit_flusher()
+    audit_queue: "asyncio.Queue[_AuditEntry]"
+    # Coalesces create_migration inserts; None in production, where each insert is sent directly
+    migration_buffer: Optional["_MigrationBuffer"]
+
+def _current_app() -> Optional[AppContext]:
+    """
+    Return the context of the session handling the current request, or None outside a request.
+    """
+    try:
+        return mcp.get_context().request_context.lifespan_context
+    except ValueError:
+        return None
+
+def _app() -> AppContext:
+    """
+    Return the context created by lifespan() for the current session.
+    """
+    app = _current_app()
+    if app is None:
+        raise RuntimeError("Supabase client is not initialized. Is the MCP server running?")
+    return app
+
+def _client() -> AsyncClient:
+    """
+    Return the Supabase client for the current session.
+    """
+    return _app().supabase
+
+class _MigrationBuffer:
+    """
+    Coalesce migration inserts from concurrent create_migration calls into one request.
+    
+    Each caller awaits its own row back. If a combined insert fails, its rows are
+    retried one at a time so a single bad row (e.g. a duplicate name) only fails
+    its own call.
+    """
+    
+    def __init__(self, supabase: AsyncClient, flush_interval: float, max_size: int):
+        self._supabase = supabase
+        self._flush_interval = flush_interval
+        self._max_size = max_size
+        self._pending: List[Tuple[Dict[str, Any], "asyncio.Future[Optional[Dict[str, Any]]]"]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set = set()
+    
+    async def insert(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Queue a row and return it as stored (None if PostgREST returned nothing).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self._max_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._flush_interval, self._start_flush)
+        return await future
+    
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+    
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], "asyncio.Future[Optional[Dict[str, Any]]]"]]) -> None:
+        try:
+            response = await self._supabase.table('migrations').insert([row for row, _ in batch]).execute()
+        except Exception as e:
+            if len(batch) > 1:
+                await asyncio.gather(*(self._flush([item]) for item in batch))
+                return
+            future = batch[0][1]
+            if not future.done():
+                future.set_exception(e)
+            return
+        
+        # PostgREST returns inserted rows in request order
+        stored = response.data or []
+        for i, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(stored[i] if i < len(stored) else None)
+    
+    async def aclose(self) -> None:
+        """
+        Send anything still pending and wait for in-flight inserts.
+        """
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+@dataclass(slots=True)
+class _AuditEntry:
+    """
+    One audit trail record, queued by log_operation() and serialized by the flusher.
+    """
+    timestamp_ns: int
+    operation: str
+    details: Dict[str, Any]
+    user_context: str
+    environment: str
+
+def _audit_line(entry: _AuditEntry) -> str:
+    """
+    Render one audit entry as an AUDIT log line.
+    """
+    log_entry = {
+        "timestamp": _EPOCH + timedelta(microseconds=entry.timestamp_ns // 1000),
+        "operation": entry.operation,
+        "details": entry.details,
+        "user_context": entry.user_context,
+        "environment": entry.environment
+    }
+    try:
+        # default=str covers values orjson has no encoder for
+        payload = orjson.dumps(log_entry, default=str).decode()
+    except TypeError:
+        # orjson rejects integers wider than 64 bits and non-str keys; the stdlib accepts both
+        log_entry["timestamp"] = log_entry["timestamp"].isoformat()
+        payload = json.dumps(log_entry, default=str, separators=(",", ":"))
+    return "AUDIT: " + payload
+
+def _write_audit(entries: List[_AuditEntry]) -> None:
+    """
+    Emit a batch of audit entries as a single log record, one AUDIT line per entry.
+    
+    Never raises: an entry that cannot be written is reported and skipped so the
+    rest of the batch, and the flusher, carry on.
+    """
+    lines = []
+    for entry in entries:
+        try:
+            lines.append(_audit_line(entry))
+        except Exception:
+            logger.exception(f"Failed to write audit entry for {entry.operation}")
+    if not lines:
+        return
+    try:
+        logger.info("\n".join(lines))
+    except Exception:
+        logger.exception(f"Failed to write {len(lines)} audit entries")
+
+async def _audit_flusher(queue: "asyncio.Queue[_AuditEntry]") -> None:
+    """
+    Write queued audit entries once AUDIT_BATCH_SIZE accumulate or AUDIT_FLUSH_INTERVAL passes.
+    """
+    loop = asyncio.get_running_loop()
+    batch: List[_AuditEntry] = []
+    try:
+        while True:
+            batch.append(await queue.get())
+            deadline = loop.time() + AUDIT_FLUSH_INTERVAL
+            while len(batch) < AUDIT_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            _write_audit(batch)
+            batch = []
+    finally:
+        # Shutdown: write whatever is still pending
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch:
+            _write_audit(batch)
 
 # Define the lifespan context for the MCP server
 @asynccontextmanager
-async def lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
+async def lifespan(server: FastMCP) -> AsyncIterator[AppContext]:
     """
     Manage the lifecycle of the MCP server, initializing the Supabase client on startup.
     """
@@ -36,62 +263,131 @@ async def lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
     if not url or not key:
         raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in environment variables.")
 
-    supabase_client: Client = create_client(url, key)
+    # One HTTP/2 keep-alive pool shared by every Supabase API call
+    http_client = httpx.AsyncClient(
+        http2=True,
+        # Admin tool calls are sparse; keep idle connections longer than httpx's 5 s default
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60.0),
+        timeout=30,
+        follow_redirects=True,
+    )
+    supabase_client: AsyncClient = await acreate_client(
+        url, key, options=AsyncClientOptions(httpx_client=http_client)
+    )
+    
+    # statement_cache_size=0 keeps the pool compatible with Supavisor transaction mode
+    db_url = os.environ.get("DATABASE_URL")
+    pg_pool = None
+    if db_url:
+        import asyncpg
+        pg_pool = await asyncpg.create_pool(
+            db_url,
+            min_size=2,
+            max_size=10,
+            statement_cache_size=0,
+            command_timeout=30,
+        )
+    
+    # Probe once so tools can skip RPCs that would fail on every call
+    has_helper_functions = None
+    has_migration_audit_log = False
+    if pg_pool is not None:
+        installed = await pg_pool.fetchval(
+            "SELECT count(DISTINCT proname) FROM pg_proc "
+            "WHERE pronamespace = 'public'::regnamespace AND proname = ANY($1::text[])",
+            list(_HELPER_FUNCTIONS)
+        )
+        has_helper_functions = installed == len(_HELPER_FUNCTIONS)
+        has_migration_audit_log = await pg_pool.fetchval(
+            "SELECT to_regclass('public.migration_audit_log') IS NOT NULL"
+        )
+    
+    audit_queue: "asyncio.Queue[_AuditEntry]" = asyncio.Queue(maxsize=AUDIT_QUEUE_SIZE)
+    audit_task = asyncio.create_task(_audit_flusher(audit_queue))
+    
+    migration_buffer = None
+    if _CONFIG.env != "production":
+        migration_buffer = _MigrationBuffer(supabase_client, MIGRATION_BUFFER_INTERVAL, MIGRATION_BUFFER_SIZE)
+    
+    app = AppContext(
+        supabase=supabase_client,
+        pg_pool=pg_pool,
+        has_helper_functions=has_helper_functions,
+        has_migration_audit_log=has_migration_audit_log,
+        audit_queue=audit_queue,
+        migration_buffer=migration_buffer,
+    )
     
     # Log startup with security info
-    logger.info(f"MCP Server starting in {ENVIRONMENT} environment")
-    logger.info(f"Additional security layer: {'enabled' if ADMIN_API_KEY else 'disabled'}")
-    logger.info(f"Confirmation required: {REQUIRE_CONFIRMATION}")
+    logger.info(f"MCP Server starting in {_CONFIG.env} environment")
+    logger.info(f"Additional security layer: {'enabled' if _CONFIG.admin_key else 'disabled'}")
+    logger.info(f"Confirmation required: {_CONFIG.require_confirm}")
+    logger.info(f"Direct Postgres connection: {'enabled' if pg_pool else 'disabled'}")
+    if has_helper_functions is False:
+        logger.info("Helper functions from security_setup.sql are not installed")
+    if pg_pool is not None and not has_migration_audit_log:
+        logger.info("migration_audit_log is not installed; migrations will not be recorded there")
     
-    yield {
-        "supabase_client": supabase_client
-    }
+    try:
+        yield app
+    finally:
+        if migration_buffer is not None:
+            await migration_buffer.aclose()
+        # Cancelling the flusher writes out any entries still queued
+        audit_task.cancel()
+        await asyncio.gather(audit_task, return_exceptions=True)
+        if pg_pool is not None:
+            await pg_pool.close()
+        await http_client.aclose()
 
 # Create the FastMCP server instance
 mcp = FastMCP(
     "Supabase Database Admin MCP Server (Secure)",
     lifespan=lifespan,
-    dependencies=["supabase", "python-dotenv"],
+    dependencies=["supabase", "python-dotenv", "asyncpg", "orjson"],
 )
 
-def log_operation(operation: str, details: Dict[str, Any], user_context: str = "mcp_user"):
+def log_operation(operation: str, details: Dict[str, Any], user_context: str = "mcp_user") -> None:
     """
     Log operations for audit trail.
+    
+    Entries are queued and serialized by the session's background flusher;
+    outside a request they are written immediately.
     """
-    log_entry = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "operation": operation,
-        "details": details,
-        "user_context": user_context,
-        "environment": ENVIRONMENT
-    }
-    logger.info(f"AUDIT: {json.dumps(log_entry)}")
-    return log_entry
+    # Nothing would be written, so don't build or queue the entry at all
+    if not _CONFIG.audit or not logger.isEnabledFor(logging.INFO):
+        return
+    log_entry = _AuditEntry(time.time_ns(), operation, details, user_context, _CONFIG.env)
+    app = _current_app()
+    if app is None:
+        _write_audit([log_entry])
+        return
+    try:
+        app.audit_queue.put_nowait(log_entry)
+    except asyncio.QueueFull:
+        # Never block a tool on the audit trail, but make the loss visible
+        logger.warning(f"Audit queue full, dropping entry for {operation}")
 
-def check_authorization(operation: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
+def check_authorization(operation: str, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Optional[str]:
     """
     Check if operation is authorized based on environment and security settings.
+    
+    Returns:
+        None when authorized, otherwise the reason it was refused.
     """
-    if ADMIN_API_KEY:
-        provided_key = context.get("admin_key") if context else None
-        if provided_key != ADMIN_API_KEY:
-            return {"authorized": False, "reason": "Invalid admin key"}
+    cfg = _CONFIG
+    if cfg.admin_key and admin_key != cfg.admin_key:
+        return "Invalid admin key"
     
     # Production environment checks
-    if ENVIRONMENT == "production":
-        destructive_ops = ["apply_migration", "rollback_migration", "execute_sql_info"]
-        if operation in destructive_ops and REQUIRE_CONFIRMATION:
-            confirmation = context.get("confirm") if context else None
-            if confirmation != "yes":
-                return {
-                    "authorized": False, 
-                    "reason": f"Production operation requires confirmation. Add 'confirm': 'yes' to proceed with {operation}"
-                }
+    if (cfg.env == "production" and operation in cfg.destructive_ops
+            and cfg.require_confirm and confirm != "yes"):
+        return f"Production operation requires confirmation. Add 'confirm': 'yes' to proceed with {operation}"
     
-    return {"authorized": True}
+    return None
 
 @mcp.tool()
-def check_security_status() -> Dict[str, Any]:
+async def check_security_status() -> Dict[str, Any]:
     """
     Check the security status of the database and identify potential issues.
     
@@ -99,31 +395,36 @@ def check_security_status() -> Dict[str, Any]:
         A dictionary containing security status and recommendations.
     """
     try:
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
+        supabase = _client()
         
         log_operation("check_security_status", {"action": "security_audit"})
         
         security_issues = []
         recommendations = []
+        rls_issue_seen = False
         
         # Check for RLS status on public tables
-        try:
-            rls_check = supabase.rpc('check_rls_status').execute()
-            if rls_check.data:
-                tables_without_rls = [t for t in rls_check.data if not t.get('rls_enabled')]
-                if tables_without_rls:
-                    security_issues.append({
-                        "severity": "HIGH",
-                        "issue": "Tables without Row Level Security",
-                        "tables": tables_without_rls,
-                        "impact": "Data accessible to unauthorized users"
-                    })
-                    recommendations.append("Enable RLS on all public tables using enable_rls_on_table()")
-        except:
+        if _app().has_helper_functions is False:
             recommendations.append("Install security helper functions from security_setup.sql")
+        else:
+            try:
+                rls_check = await supabase.rpc('check_rls_status').execute()
+                if rls_check.data:
+                    tables_without_rls = [t for t in rls_check.data if not t.get('rls_enabled')]
+                    if tables_without_rls:
+                        rls_issue_seen = True
+                        security_issues.append({
+                            "severity": "HIGH",
+                            "issue": "Tables without Row Level Security",
+                            "tables": tables_without_rls,
+                            "impact": "Data accessible to unauthorized users"
+                        })
+                        recommendations.append("Enable RLS on all public tables using enable_rls_on_table()")
+            except APIError:
+                recommendations.append("Install security helper functions from security_setup.sql")
         
         # Check environment security
-        if ENVIRONMENT == "production" and not ADMIN_API_KEY:
+        if _CONFIG.env == "production" and not _CONFIG.admin_key:
             security_issues.append({
                 "severity": "MEDIUM",
                 "issue": "No additional API key protection in production",
@@ -132,20 +433,30 @@ def check_security_status() -> Dict[str, Any]:
             recommendations.append("Set ADMIN_API_KEY environment variable for additional security")
         
         return {
-            "environment": ENVIRONMENT,
+            "environment": _CONFIG.env,
             "security_issues": security_issues,
             "recommendations": recommendations,
-            "rls_protection": len([i for i in security_issues if "RLS" in i.get("issue", "")]) == 0,
-            "additional_auth": ADMIN_API_KEY is not None,
-            "audit_logging": True,
+            "rls_protection": not rls_issue_seen,
+            "additional_auth": _CONFIG.admin_key is not None,
+            "audit_logging": _CONFIG.audit,
             "overall_status": "SECURE" if len(security_issues) == 0 else "NEEDS_ATTENTION"
         }
         
     except Exception as e:
         return {"error": f"Failed to check security status: {str(e)}"}
 
+_ENABLE_RLS_SQL = 'ALTER TABLE "{table}" ENABLE ROW LEVEL SECURITY;'
+
+# A basic policy for authenticated users
+_BASIC_POLICY_SQL = '''
+CREATE POLICY "authenticated_access" ON "{table}"
+    FOR ALL 
+    TO authenticated 
+    USING (true);
+'''
+
 @mcp.tool()
-def enable_rls_on_table(table_name: str, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Dict[str, Any]:
+async def enable_rls_on_table(table_name: str, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Dict[str, Any]:
     """
     Enable Row Level Security on a specific table.
     
@@ -159,26 +470,16 @@ def enable_rls_on_table(table_name: str, admin_key: Optional[str] = None, confir
     """
     try:
         # Check authorization
-        auth_check = check_authorization("enable_rls_on_table", {"admin_key": admin_key, "confirm": confirm})
-        if not auth_check["authorized"]:
-            return {"error": auth_check["reason"]}
+        auth_error = check_authorization("enable_rls_on_table", admin_key, confirm)
+        if auth_error:
+            return {"error": auth_error}
         
         log_operation("enable_rls_on_table", {"table": table_name})
         
-        enable_rls_sql = f'ALTER TABLE "{table_name}" ENABLE ROW LEVEL SECURITY;'
-        
-        # Create a basic policy for authenticated users
-        basic_policy_sql = f'''
-CREATE POLICY "authenticated_access" ON "{table_name}"
-    FOR ALL 
-    TO authenticated 
-    USING (true);
-'''
-        
         return {
             "table": table_name,
-            "rls_sql": enable_rls_sql,
-            "basic_policy_sql": basic_policy_sql,
+            "rls_sql": _ENABLE_RLS_SQL.format(table=table_name),
+            "basic_policy_sql": _BASIC_POLICY_SQL.format(table=table_name),
             "instructions": [
                 "1. Copy and execute the RLS SQL in Supabase SQL editor",
                 "2. Optionally create the basic policy (allows all authenticated users)",
@@ -191,8 +492,79 @@ CREATE POLICY "authenticated_access" ON "{table_name}"
     except Exception as e:
         return {"error": f"Failed to enable RLS: {str(e)}"}
 
+def _migration_result(migration_data: Dict[str, Any], migration_id: Optional[int]) -> Dict[str, Any]:
+    """
+    Build the per-migration response returned by create_migration(s).
+    """
+    security_analysis = migration_data["security_analysis"]
+    result = {
+        "success": True,
+        "migration_id": migration_id,
+        "message": f"Migration '{migration_data['name']}' created successfully",
+        "security_analysis": security_analysis,
+        "migration": migration_data
+    }
+    
+    # Add warnings for high-risk operations
+    if security_analysis.get("risk_level") == "HIGH":
+        result["warnings"] = security_analysis.get("warnings", [])
+        result["recommendations"] = [
+            "Review SQL carefully before applying",
+            "Test in development environment first",
+            "Consider backup before applying",
+            "Apply during maintenance window"
+        ]
+    
+    return result
+
+def _migration_row(name: str, up_sql: str, down_sql: str, created_at: str) -> Dict[str, Any]:
+    """
+    Build a migrations table row with security metadata.
+    """
+    return {
+        "name": name,
+        "up_sql": up_sql,
+        "down_sql": down_sql,
+        "created_at": created_at,
+        "applied": False,
+        "environment": _CONFIG.env,
+        "security_analysis": analyze_sql_security(up_sql, down_sql),
+        "created_by": "mcp_admin"
+    }
+
+async def _insert_migrations(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Store migration rows with a single insert and build one result per row.
+    """
+    # PostgREST returns inserted rows in request order
+    response = await _client().table('migrations').insert(rows).execute()
+    ids = [row['id'] for row in response.data] if response.data else [None] * len(rows)
+    return [_migration_result(row, migration_id) for row, migration_id in zip(rows, ids)]
+
+# SQLSTATE undefined_table, and PostgREST's "table not in schema cache" error
+_UNDEFINED_TABLE_CODES = frozenset({"42P01", "PGRST205"})
+
+def _is_missing_migrations_table(e: APIError) -> bool:
+    """
+    Tell whether a PostgREST error means the migrations table has not been created.
+    """
+    if e.code:
+        return e.code in _UNDEFINED_TABLE_CODES
+    return "relation \"migrations\" does not exist" in str(e)
+
+def _migrations_api_error(e: APIError) -> Dict[str, Any]:
+    """
+    Map a PostgREST error from the migrations table to a tool response.
+    """
+    if _is_missing_migrations_table(e):
+        return {
+            "error": "Migrations table not found. Run setup_migrations_table() first.",
+            "setup_required": True
+        }
+    return {"error": f"Supabase API Error: {e.message}", "details": e.details}
+
 @mcp.tool()
-def create_migration(name: str, up_sql: str, down_sql: str, admin_key: Optional[str] = None) -> Dict[str, Any]:
+async def create_migration(name: str, up_sql: str, down_sql: str, admin_key: Optional[str] = None) -> Dict[str, Any]:
     """
     Create a new database migration with enhanced security checks.
     
@@ -207,64 +579,101 @@ def create_migration(name: str, up_sql: str, down_sql: str, admin_key: Optional[
     """
     try:
         # Check authorization
-        auth_check = check_authorization("create_migration", {"admin_key": admin_key})
-        if not auth_check["authorized"]:
-            return {"error": auth_check["reason"]}
-        
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
-        
-        # Security analysis of SQL
-        security_analysis = analyze_sql_security(up_sql, down_sql)
-        
-        # Create migration record with security metadata
-        migration_data = {
-            "name": name,
-            "up_sql": up_sql,
-            "down_sql": down_sql,
-            "created_at": datetime.utcnow().isoformat(),
-            "applied": False,
-            "environment": ENVIRONMENT,
-            "security_analysis": security_analysis,
-            "created_by": "mcp_admin"
-        }
+        auth_error = check_authorization("create_migration", admin_key)
+        if auth_error:
+            return {"error": auth_error}
+        
+        migration_data = _migration_row(name, up_sql, down_sql, datetime.now(timezone.utc).isoformat())
         
         log_operation("create_migration", {
             "migration_name": name,
-            "security_risk": security_analysis.get("risk_level", "unknown")
+            "security_risk": migration_data["security_analysis"].get("risk_level", "unknown")
         })
         
-        # Store migration in migrations table
-        response = supabase.table('migrations').insert(migration_data).execute()
+        # Store migration in migrations table, sharing a request with concurrent calls outside production
+        buffer = _app().migration_buffer
+        if buffer is None:
+            return (await _insert_migrations([migration_data]))[0]
+        stored = await buffer.insert(migration_data)
+        return _migration_result(migration_data, stored['id'] if stored else None)
         
-        result = {
-            "success": True,
-            "migration_id": response.data[0]['id'] if response.data else None,
-            "message": f"Migration '{name}' created successfully",
-            "security_analysis": security_analysis,
-            "migration": migration_data
-        }
+    except APIError as e:
+        return _migrations_api_error(e)
+    except Exception as e:
+        return {"error": f"Failed to create migration: {str(e)}"}
+
+@mcp.tool()
+async def create_migrations(migrations: List[Dict[str, str]], admin_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Create several database migrations at once with a single insert.
+    
+    Args:
+        migrations: List of {"name", "up_sql", "down_sql"} objects, in the order to store them
+        admin_key: Admin API key if required
+
+    Returns:
+        A dictionary with one creation result per migration.
+    """
+    try:
+        # Check authorization
+        auth_error = check_authorization("create_migrations", admin_key)
+        if auth_error:
+            return {"error": auth_error}
         
-        # Add warnings for high-risk operations
-        if security_analysis.get("risk_level") == "HIGH":
-            result["warnings"] = security_analysis.get("warnings", [])
-            result["recommendations"] = [
-                "Review SQL carefully before applying",
-                "Test in development environment first",
-                "Consider backup before applying",
-                "Apply during maintenance window"
-            ]
+        if not migrations:
+            return {"error": "No migrations provided"}
         
-        return result
+        incomplete = [
+            i for i, m in enumerate(migrations)
+            if not all(m.get(field) for field in ("name", "up_sql", "down_sql"))
+        ]
+        if incomplete:
+            return {"error": f"Migrations at positions {incomplete} need name, up_sql and down_sql"}
+        
+        created_at = datetime.now(timezone.utc).isoformat()
+        rows = [_migration_row(m["name"], m["up_sql"], m["down_sql"], created_at) for m in migrations]
+        
+        log_operation("create_migrations", {
+            "migration_names": [row["name"] for row in rows],
+            "security_risks": [row["security_analysis"].get("risk_level", "unknown") for row in rows]
+        })
+        
+        # One insert for the whole list instead of a round-trip per migration
+        results = await _insert_migrations(rows)
+        return {
+            "success": True,
+            "count": len(results),
+            "migrations": results
+        }
         
     except APIError as e:
-        if "relation \"migrations\" does not exist" in str(e):
-            return {
-                "error": "Migrations table not found. Run setup_migrations_table() first.",
-                "setup_required": True
-            }
-        return {"error": f"Supabase API Error: {e.message}", "details": e.details}
+        return _migrations_api_error(e)
     except Exception as e:
-        return {"error": f"Failed to create migration: {str(e)}"}
+        return {"error": f"Failed to create migrations: {str(e)}"}
+
+# Risky statements flagged by analyze_sql_security() and their severity, in warning order
+_SQL_RISK_OPERATIONS = {
+    "DROP TABLE": "HIGH",
+    "DROP DATABASE": "HIGH",
+    "DELETE FROM": "HIGH",
+    "TRUNCATE": "HIGH",
+    "ALTER TABLE": "MEDIUM",
+    "DROP COLUMN": "MEDIUM",
+    "DROP INDEX": "MEDIUM",
+}
+
+# One pass over the SQL finds every risky operation; any whitespace may separate keywords.
+# Longer keywords go first so one that extends another is never shadowed by it.
+_SQL_RISK_RE = re.compile(
+    r"\b(" + "|".join(
+        op.replace(" ", r"\s+") for op in sorted(_SQL_RISK_OPERATIONS, key=len, reverse=True)
+    ) + r")\b",
+    re.IGNORECASE
+)
+
+# New tables should come with explicit RLS
+_CREATE_TABLE_RE = re.compile(r"\bCREATE\s+TABLE\b", re.IGNORECASE)
+_ROW_LEVEL_SECURITY_RE = re.compile(r"\bROW\s+LEVEL\s+SECURITY\b", re.IGNORECASE)
 
 def analyze_sql_security(up_sql: str, down_sql: str) -> Dict[str, Any]:
     """
@@ -276,33 +685,162 @@ def analyze_sql_security(up_sql: str, down_sql: str) -> Dict[str, Any]:
         "recommendations": []
     }
     
-    up_upper = up_sql.upper()
-    down_upper = down_sql.upper()
-    
-    # Check for high-risk operations
-    high_risk_operations = ["DROP TABLE", "DROP DATABASE", "DELETE FROM", "TRUNCATE"]
-    medium_risk_operations = ["ALTER TABLE", "DROP COLUMN", "DROP INDEX"]
-    
-    for op in high_risk_operations:
-        if op in up_upper or op in down_upper:
-            analysis["risk_level"] = "HIGH"
-            analysis["warnings"].append(f"Contains {op} operation")
+    found = {
+        " ".join(m.group(1).upper().split())
+        for sql in (up_sql, down_sql)
+        for m in _SQL_RISK_RE.finditer(sql)
+    }
     
-    for op in medium_risk_operations:
-        if op in up_upper or op in down_upper:
-            if analysis["risk_level"] == "LOW":
-                analysis["risk_level"] = "MEDIUM"
+    # Check for high- and medium-risk operations
+    for op, severity in _SQL_RISK_OPERATIONS.items():
+        if op in found:
+            if severity == "HIGH" or analysis["risk_level"] == "LOW":
+                analysis["risk_level"] = severity
             analysis["warnings"].append(f"Contains {op} operation")
     
     # Check for RLS considerations
-    if "CREATE TABLE" in up_upper and "ROW LEVEL SECURITY" not in up_upper:
+    if _CREATE_TABLE_RE.search(up_sql) and not _ROW_LEVEL_SECURITY_RE.search(up_sql):
         analysis["warnings"].append("New table created without explicit RLS")
         analysis["recommendations"].append("Consider enabling RLS on new tables")
     
     return analysis
 
+def _high_risk_review(migration_name: str, warnings: List[str]) -> Dict[str, Any]:
+    """
+    Build the response for a high-risk migration that must be reviewed before applying in production.
+    """
+    return {
+        "error": "High-risk migration requires manual review in production",
+        "migration_name": migration_name,
+        "security_warnings": warnings,
+        "manual_steps": [
+            "1. Review the migration SQL carefully",
+            "2. Test in staging environment",
+            "3. Backup production database",
+            "4. Apply during maintenance window",
+            "5. Monitor for issues after application"
+        ]
+    }
+
+# SQL to record a manually executed migration. The literal form is for the SQL
+# editor, which cannot bind parameters; scripted clients can prepare the $1
+# template once and execute it with "params".
+_MARK_APPLIED_SQL = "UPDATE migrations SET applied = TRUE, applied_at = NOW(), applied_by = 'manual' WHERE id = {id};"
+_MARK_APPLIED_SQL_TEMPLATE = _MARK_APPLIED_SQL.format(id="$1")
+_MARK_ROLLED_BACK_SQL = "UPDATE migrations SET applied = FALSE, applied_at = NULL, rolled_back_at = NOW(), rolled_back_by = 'manual' WHERE id = {id};"
+_MARK_ROLLED_BACK_SQL_TEMPLATE = _MARK_ROLLED_BACK_SQL.format(id="$1")
+
+# Same record apply_migration_by_id() / rollback_migration_by_id() write
+_MIGRATION_AUDIT_SQL = (
+    "INSERT INTO migration_audit_log (migration_id, action, executed_by, execution_time_ms, success, error_message) "
+    "VALUES ($1, $2, current_user, $3, $4, $5)"
+)
+
+async def _run_locked_migration(conn: "asyncpg.Connection", migration: Any, action: str, sql: str, audit_log: bool) -> Tuple[Optional[str], float]:
+    """
+    Run a migration's SQL in a savepoint and record the outcome in migration_audit_log.
+    
+    Returns the error message (None on success) and the execution time in ms. A
+    failed migration is undone, but its audit row is kept by the outer transaction.
+    The audit row is skipped when migration_audit_log is not installed.
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        async with conn.transaction():
+            await conn.execute(sql)
+    except Exception as e:
+        error = str(e)
+    execution_time_ms = round((time.perf_counter() - started) * 1000, 2)
+    if audit_log:
+        await conn.execute(_MIGRATION_AUDIT_SQL, migration['id'], action, execution_time_ms, error is None, error)
+    return error, execution_time_ms
+
+async def _apply_over_pool(pool: "asyncpg.Pool", migration_id: int, audit_log: bool) -> Dict[str, Any]:
+    """
+    Apply a migration in one transaction over the direct Postgres pool.
+    
+    The row is read with FOR UPDATE inside the transaction, so the checks and the
+    SQL that runs all come from the locked row.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            migration = await conn.fetchrow("SELECT * FROM migrations WHERE id = $1 FOR UPDATE", migration_id)
+            if migration is None:
+                return {"error": f"Migration with ID {migration_id} not found"}
+            if migration['applied']:
+                return {"error": f"Migration '{migration['name']}' has already been applied"}
+            
+            log_operation("apply_migration", {
+                "migration_id": migration_id,
+                "migration_name": migration['name'],
+                "environment": _CONFIG.env
+            })
+            
+            # jsonb comes back as text without a registered codec
+            security_analysis = json.loads(migration['security_analysis'] or '{}')
+            if security_analysis.get('risk_level') == 'HIGH' and _CONFIG.env == 'production':
+                return _high_risk_review(migration['name'], security_analysis.get('warnings', []))
+            
+            error, execution_time_ms = await _run_locked_migration(conn, migration, 'apply', migration['up_sql'], audit_log)
+            if error is not None:
+                return {"error": f"Failed to apply migration '{migration['name']}': {error}"}
+            
+            applied_at = await conn.fetchval(
+                "UPDATE migrations SET applied = TRUE, applied_at = NOW(), applied_by = 'mcp_admin' "
+                "WHERE id = $1 RETURNING applied_at",
+                migration_id
+            )
+    
+    _SCHEMA_CACHE.clear()
+    
+    return {
+        "success": True,
+        "message": f"Migration '{migration['name']}' applied successfully in {execution_time_ms}ms",
+        "applied_at": applied_at.isoformat()
+    }
+
+async def _rollback_over_pool(pool: "asyncpg.Pool", migration_id: int, audit_log: bool) -> Dict[str, Any]:
+    """
+    Roll back a migration in one transaction over the direct Postgres pool.
+    
+    The row is read with FOR UPDATE inside the transaction, so the check and the
+    SQL that runs both come from the locked row.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            migration = await conn.fetchrow("SELECT * FROM migrations WHERE id = $1 FOR UPDATE", migration_id)
+            if migration is None:
+                return {"error": f"Migration with ID {migration_id} not found"}
+            if not migration['applied']:
+                return {"error": f"Migration '{migration['name']}' has not been applied yet"}
+            
+            log_operation("rollback_migration", {
+                "migration_id": migration_id,
+                "migration_name": migration['name'],
+                "environment": _CONFIG.env
+            })
+            
+            error, execution_time_ms = await _run_locked_migration(conn, migration, 'rollback', migration['down_sql'], audit_log)
+            if error is not None:
+                return {"error": f"Failed to rollback migration '{migration['name']}': {error}"}
+            
+            rolled_back_at = await conn.fetchval(
+                "UPDATE migrations SET applied = FALSE, applied_at = NULL, rolled_back_at = NOW(), rolled_back_by = 'mcp_admin' "
+                "WHERE id = $1 RETURNING rolled_back_at",
+                migration_id
+            )
+    
+    _SCHEMA_CACHE.clear()
+    
+    return {
+        "success": True,
+        "message": f"Migration '{migration['name']}' rolled back successfully in {execution_time_ms}ms",
+        "rolled_back_at": rolled_back_at.isoformat()
+    }
+
 @mcp.tool()
-def apply_migration(migration_id: int, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Dict[str, Any]:
+async def apply_migration(migration_id: int, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Dict[str, Any]:
     """
     Apply a specific migration to the database with security checks.
     
@@ -316,14 +854,60 @@ def apply_migration(migration_id: int, admin_key: Optional[str] = None, confirm:
     """
     try:
         # Check authorization
-        auth_check = check_authorization("apply_migration", {"admin_key": admin_key, "confirm": confirm})
-        if not auth_check["authorized"]:
-            return {"error": auth_check["reason"]}
+        auth_error = check_authorization("apply_migration", admin_key, confirm)
+        if auth_error:
+            return {"error": auth_error}
+        
+        app = _app()
+        supabase = app.supabase
+        
+        # With a direct Postgres pool everything happens in one locked transaction
+        if app.pg_pool is not None:
+            return await _apply_over_pool(app.pg_pool, migration_id, app.has_migration_audit_log)
         
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
+        # Fetch, check, apply and mark the migration in a single RPC round-trip
+        try:
+            result = await supabase.rpc('apply_migration_by_id', {
+                'migration_id_param': migration_id,
+                'block_high_risk': _CONFIG.env == 'production',
+                'applied_by_param': 'mcp_admin'
+            }).execute()
+        except APIError:
+            # Helper functions not installed; fall back to manual steps below
+            result = None
+        
+        if result is not None:
+            outcome = result.data or {}
+            status = outcome.get('status')
+            
+            if status == 'not_found':
+                return {"error": f"Migration with ID {migration_id} not found"}
+            if status == 'already_applied':
+                return {"error": f"Migration '{outcome['name']}' has already been applied"}
+            if status not in ('high_risk', 'applied', 'failed'):
+                return {"error": f"Unexpected response from apply_migration_by_id: {outcome}"}
+            
+            log_operation("apply_migration", {
+                "migration_id": migration_id,
+                "migration_name": outcome['name'],
+                "environment": _CONFIG.env
+            })
+            
+            if status == 'high_risk':
+                return _high_risk_review(outcome['name'], outcome.get('warnings', []))
+            if status == 'failed':
+                return {"error": f"Failed to apply migration '{outcome['name']}': {outcome.get('error')}"}
+            
+            _SCHEMA_CACHE.clear()
+            
+            return {
+                "success": True,
+                "message": f"Migration '{outcome['name']}' applied successfully in {outcome.get('execution_time_ms')}ms",
+                "applied_at": outcome.get('applied_at')
+            }
         
         # Get migration details
-        migration_response = supabase.table('migrations').select('*').eq('id', migration_id).execute()
+        migration_response = await supabase.table('migrations').select('*').eq('id', migration_id).execute()
         
         if not migration_response.data:
             return {"error": f"Migration with ID {migration_id} not found"}
@@ -336,56 +920,30 @@ def apply_migration(migration_id: int, admin_key: Optional[str] = None, confirm:
         log_operation("apply_migration", {
             "migration_id": migration_id,
             "migration_name": migration['name'],
-            "environment": ENVIRONMENT
+            "environment": _CONFIG.env
         })
         
         # Security check before applying
         security_analysis = migration.get('security_analysis', {})
-        if security_analysis.get('risk_level') == 'HIGH' and ENVIRONMENT == 'production':
-            return {
-                "error": "High-risk migration requires manual review in production",
-                "migration_name": migration['name'],
-                "security_warnings": security_analysis.get('warnings', []),
-                "manual_steps": [
-                    "1. Review the migration SQL carefully",
-                    "2. Test in staging environment",
-                    "3. Backup production database",
-                    "4. Apply during maintenance window",
-                    "5. Monitor for issues after application"
-                ]
-            }
+        if security_analysis.get('risk_level') == 'HIGH' and _CONFIG.env == 'production':
+            return _high_risk_review(migration['name'], security_analysis.get('warnings', []))
         
-        # Try to use custom function for automatic application
-        try:
-            result = supabase.rpc('apply_migration_by_id', {'migration_id_param': migration_id}).execute()
-            
-            # Update migration status
-            supabase.table('migrations').update({
-                'applied': True,
-                'applied_at': datetime.utcnow().isoformat(),
-                'applied_by': 'mcp_admin'
-            }).eq('id', migration_id).execute()
-            
-            return {
-                "success": True,
-                "message": result.data if result.data else f"Migration '{migration['name']}' applied successfully",
-                "applied_at": datetime.utcnow().isoformat()
-            }
-        except:
-            # Fallback: return SQL for manual execution
-            return {
-                "migration_name": migration['name'],
-                "sql_to_execute": migration['up_sql'],
-                "message": f"Execute this SQL manually, then mark migration as applied",
-                "manual_mark_sql": f"UPDATE migrations SET applied = TRUE, applied_at = NOW(), applied_by = 'manual' WHERE id = {migration_id};",
-                "security_analysis": security_analysis
-            }
+        # Fallback: return SQL for manual execution
+        return {
+            "migration_name": migration['name'],
+            "sql_to_execute": migration['up_sql'],
+            "message": f"Execute this SQL manually, then mark migration as applied",
+            "manual_mark_sql": _MARK_APPLIED_SQL.format(id=migration_id),
+            "manual_mark_sql_template": _MARK_APPLIED_SQL_TEMPLATE,
+            "params": [migration_id],
+            "security_analysis": security_analysis
+        }
         
     except Exception as e:
         return {"error": f"Failed to apply migration: {str(e)}"}
 
 @mcp.tool()
-def rollback_migration(migration_id: int, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Dict[str, Any]:
+async def rollback_migration(migration_id: int, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Dict[str, Any]:
     """
     Rollback a specific migration with security checks.
     
@@ -399,14 +957,57 @@ def rollback_migration(migration_id: int, admin_key: Optional[str] = None, confi
     """
     try:
         # Check authorization
-        auth_check = check_authorization("rollback_migration", {"admin_key": admin_key, "confirm": confirm})
-        if not auth_check["authorized"]:
-            return {"error": auth_check["reason"]}
+        auth_error = check_authorization("rollback_migration", admin_key, confirm)
+        if auth_error:
+            return {"error": auth_error}
+        
+        app = _app()
+        supabase = app.supabase
+        
+        # With a direct Postgres pool everything happens in one locked transaction
+        if app.pg_pool is not None:
+            return await _rollback_over_pool(app.pg_pool, migration_id, app.has_migration_audit_log)
         
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
+        # Fetch, check, roll back and mark the migration in a single RPC round-trip
+        try:
+            result = await supabase.rpc('rollback_migration_by_id', {
+                'migration_id_param': migration_id,
+                'rolled_back_by_param': 'mcp_admin'
+            }).execute()
+        except APIError:
+            # Helper functions not installed; fall back to manual steps below
+            result = None
+        
+        if result is not None:
+            outcome = result.data or {}
+            status = outcome.get('status')
+            
+            if status == 'not_found':
+                return {"error": f"Migration with ID {migration_id} not found"}
+            if status == 'not_applied':
+                return {"error": f"Migration '{outcome['name']}' has not been applied yet"}
+            if status not in ('rolled_back', 'failed'):
+                return {"error": f"Unexpected response from rollback_migration_by_id: {outcome}"}
+            
+            log_operation("rollback_migration", {
+                "migration_id": migration_id,
+                "migration_name": outcome['name'],
+                "environment": _CONFIG.env
+            })
+            
+            if status == 'failed':
+                return {"error": f"Failed to rollback migration '{outcome['name']}': {outcome.get('error')}"}
+            
+            _SCHEMA_CACHE.clear()
+            
+            return {
+                "success": True,
+                "message": f"Migration '{outcome['name']}' rolled back successfully in {outcome.get('execution_time_ms')}ms",
+                "rolled_back_at": outcome.get('rolled_back_at')
+            }
         
         # Get migration details
-        migration_response = supabase.table('migrations').select('*').eq('id', migration_id).execute()
+        migration_response = await supabase.table('migrations').select('*').eq('id', migration_id).execute()
         
         if not migration_response.data:
             return {"error": f"Migration with ID {migration_id} not found"}
@@ -419,71 +1020,87 @@ def rollback_migration(migration_id: int, admin_key: Optional[str] = None, confi
         log_operation("rollback_migration", {
             "migration_id": migration_id,
             "migration_name": migration['name'],
-            "environment": ENVIRONMENT
+            "environment": _CONFIG.env
         })
         
-        # Try to use custom function for automatic rollback
-        try:
-            result = supabase.rpc('rollback_migration_by_id', {'migration_id_param': migration_id}).execute()
-            
-            # Update migration status
-            supabase.table('migrations').update({
-                'applied': False,
-                'applied_at': None,
-                'rolled_back_at': datetime.utcnow().isoformat(),
-                'rolled_back_by': 'mcp_admin'
-            }).eq('id', migration_id).execute()
-            
-            return {
-                "success": True,
-                "message": result.data if result.data else f"Migration '{migration['name']}' rolled back successfully",
-                "rolled_back_at": datetime.utcnow().isoformat()
-            }
-        except:
-            # Fallback: return SQL for manual execution
-            return {
-                "migration_name": migration['name'],
-                "sql_to_execute": migration['down_sql'],
-                "message": f"Execute this SQL manually, then mark migration as rolled back",
-                "manual_mark_sql": f"UPDATE migrations SET applied = FALSE, applied_at = NULL, rolled_back_at = NOW(), rolled_back_by = 'manual' WHERE id = {migration_id};"
-            }
+        # Fallback: return SQL for manual execution
+        return {
+            "migration_name": migration['name'],
+            "sql_to_execute": migration['down_sql'],
+            "message": f"Execute this SQL manually, then mark migration as rolled back",
+            "manual_mark_sql": _MARK_ROLLED_BACK_SQL.format(id=migration_id),
+            "manual_mark_sql_template": _MARK_ROLLED_BACK_SQL_TEMPLATE,
+            "params": [migration_id]
+        }
         
     except Exception as e:
         return {"error": f"Failed to rollback migration: {str(e)}"}
 
+# Columns returned by list_migrations (the up/down SQL bodies are left out)
+_MIGRATION_LIST_COLUMNS = (
+    "id", "name", "applied", "created_at", "applied_at", "rolled_back_at",
+    "environment", "security_analysis", "created_by", "applied_by", "rolled_back_by"
+)
+
 @mcp.tool()
-def list_migrations() -> Dict[str, Any]:
+async def list_migrations(include_rows: bool = True) -> Dict[str, Any]:
     """
     List all migrations and their status with security metadata.
 
+    Args:
+        include_rows: Include the migration rows; when False only the summary counts are fetched
+
     Returns:
         A dictionary containing all migrations with security information.
     """
     try:
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
+        supabase = _client()
         
-        response = supabase.table('migrations').select('*').order('created_at').execute()
-        
-        migrations = response.data if response.data else []
+        if include_rows:
+            response = await supabase.table('migrations').select(*_MIGRATION_LIST_COLUMNS).order('created_at').execute()
+            
+            migrations = response.data if response.data else []
+            total = len(migrations)
+            applied = high_risk = 0
+            for m in migrations:
+                if m.get('applied'):
+                    applied += 1
+                # security_analysis may be NULL on rows created outside this server
+                if (m.get('security_analysis') or {}).get('risk_level') == 'HIGH':
+                    high_risk += 1
+        else:
+            # Let PostgREST count server-side instead of transferring every row
+            total_response, applied_response, high_risk_response = await asyncio.gather(
+                supabase.table('migrations').select('id', count='exact', head=True).execute(),
+                supabase.table('migrations').select('id', count='exact', head=True).eq('applied', True).execute(),
+                supabase.table('migrations').select('id', count='exact', head=True)
+                    .eq('security_analysis->>risk_level', 'HIGH').execute()
+            )
+            total = total_response.count or 0
+            applied = applied_response.count or 0
+            high_risk = high_risk_response.count or 0
         
         # Add security summary
         security_summary = {
-            "total_migrations": len(migrations),
-            "applied": len([m for m in migrations if m.get('applied')]),
-            "pending": len([m for m in migrations if not m.get('applied')]),
-            "high_risk": len([m for m in migrations if m.get('security_analysis', {}).get('risk_level') == 'HIGH']),
-            "environment": ENVIRONMENT
+            "total_migrations": total,
+            "applied": applied,
+            "pending": total - applied,
+            "high_risk": high_risk,
+            "environment": _CONFIG.env
         }
         
         log_operation("list_migrations", security_summary)
         
+        if not include_rows:
+            return {"security_summary": security_summary}
+        
         return {
             "migrations": migrations,
             "security_summary": security_summary
         }
         
     except APIError as e:
-        if "relation \"migrations\" does not exist" in str(e):
+        if _is_missing_migrations_table(e):
             return {
                 "error": "Migrations table does not exist. Run setup_migrations_table() first.",
                 "migrations": [],
@@ -494,18 +1111,7 @@ def list_migrations() -> Dict[str, Any]:
     except Exception as e:
         return {"error": f"Failed to list migrations: {str(e)}"}
 
-@mcp.tool()
-def setup_migrations_table() -> Dict[str, Any]:
-    """
-    Set up the enhanced migrations table with security features.
-
-    Returns:
-        A dictionary containing the setup result.
-    """
-    try:
-        log_operation("setup_migrations_table", {"environment": ENVIRONMENT})
-        
-        create_table_sql = """
+_SETUP_MIGRATIONS_SQL = """
 -- Enhanced migration tracking table with security features
 CREATE TABLE IF NOT EXISTS migrations (
     id SERIAL PRIMARY KEY,
@@ -536,11 +1142,22 @@ CREATE POLICY "admin_access" ON migrations
     FOR ALL 
     TO service_role 
     USING (true);
-        """
+"""
+
+@mcp.tool()
+async def setup_migrations_table() -> Dict[str, Any]:
+    """
+    Set up the enhanced migrations table with security features.
+
+    Returns:
+        A dictionary containing the setup result.
+    """
+    try:
+        log_operation("setup_migrations_table", {"environment": _CONFIG.env})
         
         return {
             "message": "Enhanced migrations table setup SQL ready",
-            "sql": create_table_sql,
+            "sql": _SETUP_MIGRATIONS_SQL,
             "instructions": [
                 "1. Copy the SQL above",
                 "2. Go to your Supabase SQL Editor",
@@ -560,68 +1177,232 @@ CREATE POLICY "admin_access" ON migrations
     except Exception as e:
         return {"error": f"Failed to setup migrations table: {str(e)}"}
 
+async def _copy_table_data(pool: "asyncpg.Pool", table_name: str) -> Tuple[str, int]:
+    """
+    Dump a table's rows with COPY ... TO STDOUT, returning the text-format data and row count.
+    
+    Limited to the public schema, the same scope as the PostgREST path.
+    """
+    chunks: List[bytes] = []
+
+    async def collect(data: bytes) -> None:
+        chunks.append(data)
+
+    async with pool.acquire() as conn:
+        status = await conn.copy_from_table(table_name, schema_name='public', output=collect)
+
+    return b"".join(chunks).decode("utf-8"), int(status.split()[-1])
+
+# Doubles embedded single quotes in one C-level pass
+_QUOTE_TABLE = str.maketrans({"'": "''"})
+
+def _quote_sql_string(value: str) -> str:
+    """
+    Render a string as a single-quoted SQL literal.
+    """
+    if "'" not in value:
+        return "'" + value + "'"
+    return "'" + value.translate(_QUOTE_TABLE) + "'"
+
+def _quote_sql_json(value: Any) -> str:
+    """
+    Render a json/jsonb object or array as quoted JSON text.
+    """
+    return _quote_sql_string(json.dumps(value, separators=(",", ":")))
+
+def _array_element(value: Any) -> str:
+    """
+    Render one element of a Postgres array literal; nested lists become nested dimensions.
+    """
+    if value is None:
+        return 'NULL'
+    value_type = type(value)
+    if value_type is list:
+        return '{' + ','.join(map(_array_element, value)) + '}'
+    if value_type is bool:
+        return 'true' if value else 'false'
+    if value_type is int or value_type is float:
+        return repr(value)
+    text = json.dumps(value, separators=(",", ":")) if value_type is dict else str(value)
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _quote_sql_array(value: List[Any]) -> str:
+    """
+    Render a Postgres array column, which PostgREST returns as a JSON array, as a quoted '{...}' literal.
+    """
+    return _quote_sql_string(_array_element(value))
+
+# SQL literal renderers for the JSON types PostgREST rows carry, keyed by exact type.
+# Lists are json/jsonb arrays here; array columns go through _quote_sql_array instead.
+_SQL_LITERALS = {
+    type(None): lambda v: 'NULL',
+    bool: lambda v: 'TRUE' if v else 'FALSE',
+    int: str,
+    float: repr,
+    str: _quote_sql_string,
+    dict: _quote_sql_json,
+    list: _quote_sql_json,
+}
+
+def _insert_prefix(table_name: str, columns: Iterable[str]) -> str:
+    """
+    Render the INSERT ... VALUES header shared by every batch of a table.
+    """
+    column_list = ', '.join(f'"{c}"' for c in columns)
+    return f'INSERT INTO "{table_name}" ({column_list}) VALUES\n'
+
+def _render_rows(rows: List[Dict[str, Any]], array_columns: frozenset) -> Iterator[str]:
+    """
+    Yield each row as a parenthesized tuple of SQL literals.
+    """
+    literal = _SQL_LITERALS.get
+    if not array_columns:
+        for row in rows:
+            yield f"({', '.join(literal(type(v), str)(v) for v in row.values())})"
+        return
+    for row in rows:
+        yield f"({', '.join(_quote_sql_array(v) if k in array_columns and type(v) is list else literal(type(v), str)(v) for k, v in row.items())})"
+
+def _write_insert_batches(out: io.StringIO, insert_prefix: str, rows: List[Dict[str, Any]], array_columns: frozenset) -> None:
+    """
+    Write rows as multi-row INSERT statements of up to BACKUP_INSERT_BATCH_SIZE rows each.
+    """
+    for start in range(0, len(rows), BACKUP_INSERT_BATCH_SIZE):
+        out.write(insert_prefix)
+        out.write(",\n".join(_render_rows(rows[start:start + BACKUP_INSERT_BATCH_SIZE], array_columns)))
+        out.write(";\n")
+
+# information_schema data types with no btree ordering operator. ARRAY and
+# USER-DEFINED depend on an element or base type that isn't reported, so they're skipped too
+_UNORDERABLE_TYPES = frozenset({
+    "json", "xml", "point", "line", "lseg", "box", "path", "polygon", "circle", "ARRAY", "USER-DEFINED",
+})
+
+async def _backup_columns(table_name: str) -> List[Dict[str, Any]]:
+    """
+    Fetch the table's column metadata for a backup, or [] when describe_table_secure() is unavailable.
+    """
+    if _app().has_helper_functions is False:
+        return []
+    try:
+        return await _describe(table_name)
+    except APIError:
+        return []
+
+def _backup_sort_columns(schema: List[Dict[str, Any]]) -> List[str]:
+    """
+    Pick the columns that give offset paging a stable row order.
+    
+    Uses the primary key when there is one, otherwise every column whose type
+    Postgres can sort. Empty when the schema is unknown or nothing is sortable.
+    """
+    primary_key = [c['column_name'] for c in schema if c.get('is_primary_key')]
+    if primary_key:
+        return list(dict.fromkeys(primary_key))
+    return list(dict.fromkeys(c['column_name'] for c in schema if c.get('data_type') not in _UNORDERABLE_TYPES))
+
+async def _write_paged_inserts(supabase: AsyncClient, out: io.StringIO, table_name: str) -> int:
+    """
+    Write a table's rows as INSERT batches, reading up to BACKUP_PAGE_SIZE rows per request.
+    
+    Each page is formatted while the next one is being fetched. Pages are read by
+    offset in primary-key order (or by every sortable column when there is no key),
+    so Postgres returns the rows in the same order for every page. Without a usable
+    sort key the pages are read unordered and the backup says so. Separate requests
+    still see separate snapshots, so rows written during the backup may be missed
+    or repeated; the COPY path gives a consistent snapshot.
+    
+    Array columns are written as '{...}' literals using describe_table_secure()'s
+    data_type. Without it they can't be told apart from json, so they're written as
+    JSON text that won't restore into an array column, and the backup says so.
+    """
+    schema = await _backup_columns(table_name)
+    order_by = _backup_sort_columns(schema)
+    array_columns = frozenset(c['column_name'] for c in schema if c.get('data_type') == 'ARRAY')
+    
+    def fetch_page(offset: int):
+        query = supabase.table(table_name).select('*')
+        for column in order_by:
+            query = query.order(column)
+        return query.range(offset, offset + BACKUP_PAGE_SIZE - 1).execute()
+    
+    rows = (await fetch_page(0)).data or []
+    if not rows:
+        return 0
+    
+    out.write(f"-- Data for table: {table_name}\n")
+    if not order_by:
+        out.write("-- No sortable key: row order is not stable across pages, so rows may be missed or repeated\n")
+    if not schema:
+        out.write("-- Column types unknown: array columns are written as JSON text and will not restore\n")
+    out.write("\n")
+    # PostgREST returns the same columns in the same order on every page
+    insert_prefix = _insert_prefix(table_name, rows[0])
+    row_count = 0
+    
+    # PostgREST caps responses at db-max-rows, which may be below BACKUP_PAGE_SIZE,
+    # so a short page doesn't mean the end of the table; only an empty one does
+    while rows:
+        row_count += len(rows)
+        next_response, _ = await asyncio.gather(
+            fetch_page(row_count),
+            asyncio.to_thread(_write_insert_batches, out, insert_prefix, rows, array_columns)
+        )
+        rows = next_response.data or []
+    
+    out.write(f"-- {row_count} rows\n")
+    return row_count
+
 # Keep existing tools but add security checks
 @mcp.tool()
-def backup_table(table_name: str, include_data: bool = True, admin_key: Optional[str] = None) -> Dict[str, Any]:
+async def backup_table(table_name: str, include_data: bool = True, admin_key: Optional[str] = None) -> Dict[str, Any]:
     """
     Generate SQL to backup a table structure and optionally its data.
     """
     try:
         # Check authorization for sensitive operations
-        auth_check = check_authorization("backup_table", {"admin_key": admin_key})
-        if not auth_check["authorized"]:
-            return {"error": auth_check["reason"]}
+        auth_error = check_authorization("backup_table", admin_key)
+        if auth_error:
+            return {"error": auth_error}
         
-        supabase: Client = mcp.get_context().request_context.lifespan_context["supabase_client"]
+        app = _app()
+        supabase = app.supabase
         
         log_operation("backup_table", {"table": table_name, "include_data": include_data})
         
-        backup_sql = []
-        backup_sql.append(f"-- Backup for table: {table_name}")
-        backup_sql.append(f"-- Generated at: {datetime.utcnow().isoformat()}")
-        backup_sql.append(f"-- Environment: {ENVIRONMENT}")
-        backup_sql.append("")
+        backup_sql = io.StringIO()
+        backup_sql.write(f"-- Backup for table: {table_name}\n")
+        backup_sql.write(f"-- Generated at: {datetime.now(timezone.utc).isoformat()}\n")
+        backup_sql.write(f"-- Environment: {_CONFIG.env}\n\n")
         
         if include_data:
             try:
-                response = supabase.table(table_name).select('*').execute()
-                
-                if response.data:
-                    backup_sql.append(f"-- Data for table: {table_name}")
-                    backup_sql.append(f"-- {len(response.data)} rows")
-                    backup_sql.append("")
-                    
-                    for row in response.data:
-                        columns = ', '.join([f'"{k}"' for k in row.keys()])
-                        values = []
-                        for v in row.values():
-                            if v is None:
-                                values.append('NULL')
-                            elif isinstance(v, str):
-                                values.append(f"'{v.replace(chr(39), chr(39)+chr(39))}'")
-                            elif isinstance(v, bool):
-                                values.append('TRUE' if v else 'FALSE')
-                            else:
-                                values.append(str(v))
-                        values_str = ', '.join(values)
-                        backup_sql.append(f'INSERT INTO "{table_name}" ({columns}) VALUES ({values_str});')
+                if app.pg_pool is not None:
+                    # Dump rows server-side with COPY instead of rebuilding INSERTs from JSON
+                    copy_data, row_count = await _copy_table_data(app.pg_pool, table_name)
+                    backup_sql.write(f"-- Data for table: {table_name}\n")
+                    backup_sql.write(f"-- {row_count} rows\n\n")
+                    backup_sql.write(f'COPY "{table_name}" FROM stdin;\n')
+                    backup_sql.write(f"{copy_data}\\.\n")
+                else:
+                    row_count = await _write_paged_inserts(supabase, backup_sql, table_name)
                 
                 return {
                     "table": table_name,
-                    "backup_sql": "\n".join(backup_sql),
+                    "backup_sql": backup_sql.getvalue(),
                     "include_data": include_data,
-                    "rows_backed_up": len(response.data) if response.data else 0,
+                    "rows_backed_up": row_count,
                     "security_note": "Backup contains sensitive data - store securely"
                 }
             except Exception as e:
                 return {"error": f"Failed to backup table data: {str(e)}"}
         else:
-            backup_sql.append(f"-- Structure only backup for: {table_name}")
-            backup_sql.append("-- Use pg_dump or Supabase backup tools for structure")
+            backup_sql.write(f"-- Structure only backup for: {table_name}\n")
+            backup_sql.write("-- Use pg_dump or Supabase backup tools for structure\n")
             
             return {
                 "table": table_name,
-                "backup_sql": "\n".join(backup_sql),
+                "backup_sql": backup_sql.getvalue(),
                 "include_data": False,
                 "note": "For structure backup, use Supabase backup tools or pg_dump"
             }
@@ -629,51 +1410,46 @@ def backup_table(table_name: str, include_data: bool = True, admin_key: Optional
     except Exception as e:
         return {"error": f"Failed to backup table {table_name}: {str(e)}"}
 
+# Leading SQL keyword -> (description, read-only)
+_SQL_VERB_RE = re.compile(r"\w+")
+_SQL_KINDS = {
+    "SELECT": ("SELECT (Read-only)", True),
+    "INSERT": ("INSERT (Modifies data)", False),
+    "UPDATE": ("UPDATE (Modifies data)", False),
+    "DELETE": ("DELETE (Removes data)", False),
+    "CREATE": ("CREATE (Schema change)", False),
+    "ALTER": ("ALTER (Schema change)", False),
+    "DROP": ("DROP (Destructive operation)", False),
+}
+
 @mcp.tool()
-def execute_sql_info(sql: str, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Dict[str, Any]:
+async def execute_sql_info(sql: str, admin_key: Optional[str] = None, confirm: Optional[str] = None) -> Dict[str, Any]:
     """
     Provide enhanced information about SQL execution with security analysis.
     """
     try:
         # Check authorization
-        auth_check = check_authorization("execute_sql_info", {"admin_key": admin_key, "confirm": confirm})
-        if not auth_check["authorized"]:
-            return {"error": auth_check["reason"]}
+        auth_error = check_authorization("execute_sql_info", admin_key, confirm)
+        if auth_error:
+            return {"error": auth_error}
         
         sql_clean = sql.strip()
-        sql_upper = sql_clean.upper()
         
         log_operation("execute_sql_info", {"sql_type": "analysis"})
         
         # Enhanced SQL analysis
         analysis = analyze_sql_security(sql_clean, "")
         
-        # Analyze SQL type
-        sql_type = "UNKNOWN"
-        is_safe = False
-        
-        if sql_upper.startswith('SELECT'):
-            sql_type = "SELECT (Read-only)"
-            is_safe = True
-        elif sql_upper.startswith('INSERT'):
-            sql_type = "INSERT (Modifies data)"
-        elif sql_upper.startswith('UPDATE'):
-            sql_type = "UPDATE (Modifies data)"
-        elif sql_upper.startswith('DELETE'):
-            sql_type = "DELETE (Removes data)"
-        elif sql_upper.startswith('CREATE'):
-            sql_type = "CREATE (Schema change)"
-        elif sql_upper.startswith('ALTER'):
-            sql_type = "ALTER (Schema change)"
-        elif sql_upper.startswith('DROP'):
-            sql_type = "DROP (Destructive operation)"
+        # Analyze SQL type from its leading keyword
+        verb = _SQL_VERB_RE.match(sql_clean)
+        sql_type, is_safe = _SQL_KINDS.get(verb.group().upper() if verb else None, ("UNKNOWN", False))
         
         return {
             "sql": sql_clean,
             "type": sql_type,
             "is_safe": is_safe,
             "security_analysis": analysis,
-            "environment": ENVIRONMENT,
+            "environment": _CONFIG.env,
             "instructions": [
                 "1. Copy the SQL statement",
                 "2. Open Supabase SQL Editor",
@@ -689,35 +1465,140 @@ def execute_sql_info(sql: str, admin_key: Optional[str] = None, confirm: Optiona
     except Exception as e:
         return {"error": f"Failed to analyze SQL: {str(e)}"}
 
+def _setup_required(functions: str) -> Dict[str, Any]:
+    """
+    Build the response for tools whose helper functions are not installed.
+    """
+    return {
+        "error": "Schema helper functions not found",
+        "message": f"Run security_setup.sql in the Supabase SQL Editor to install {functions}",
+        "setup_required": True
+    }
+
 # Keep other existing tools unchanged but add logging
 @mcp.tool()
-def list_tables() -> Dict[str, Any]:
+async def list_tables() -> Dict[str, Any]:
     """List all tables with security context."""
     log_operation("list_tables", {"action": "schema_inspection"})
-    # ... existing implementation
+    
+    if _app().has_helper_functions is False:
+        return _setup_required("get_table_security_info()")
+    
+    try:
+        response = await _client().rpc('get_table_security_info').execute()
+        tables = response.data or []
+        return {
+            "tables": tables,
+            "count": len(tables)
+        }
+    except APIError:
+        return _setup_required("get_table_security_info()")
+    except Exception as e:
+        return {"error": f"Failed to list tables: {str(e)}"}
+
+async def _describe(table_name: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Fetch column metadata for one table, or all public tables, through the cache.
+    """
+    if table_name in _SCHEMA_CACHE:
+        _SCHEMA_CACHE.move_to_end(table_name)
+        return _SCHEMA_CACHE[table_name]
+    
+    supabase = _client()
+    if table_name:
+        response = await supabase.rpc('describe_table_secure', {'table_name_param': table_name}).execute()
+    else:
+        response = await supabase.rpc('get_all_schemas_secure').execute()
+    
+    schema = response.data or []
+    # Don't cache misses; the table may be created later
+    if schema:
+        _SCHEMA_CACHE[table_name] = schema
+        if len(_SCHEMA_CACHE) > SCHEMA_CACHE_SIZE:
+            _SCHEMA_CACHE.popitem(last=False)
+    return schema
 
 @mcp.tool()
-def get_schema(table_name: Optional[str] = None) -> Dict[str, Any]:
+async def get_schema(table_name: Optional[str] = None) -> Dict[str, Any]:
     """Get schema with security context."""
     log_operation("get_schema", {"table": table_name or "all"})
-    # ... existing implementation
+    
+    if _app().has_helper_functions is False:
+        return _setup_required("describe_table_secure() and get_all_schemas_secure()")
+    
+    try:
+        schema = await _describe(table_name)
+        return {
+            "table": table_name or "all",
+            "schema": list(schema)
+        }
+    except APIError:
+        return _setup_required("describe_table_secure() and get_all_schemas_secure()")
+    except Exception as e:
+        return {"error": f"Failed to get schema: {str(e)}"}
+
+@mcp.tool()
+async def describe_database() -> Dict[str, Any]:
+    """Get tables, all column schemas and the migration count in one call."""
+    log_operation("describe_database", {"action": "schema_inspection"})
+    
+    if _app().has_helper_functions is False:
+        return _setup_required("get_table_security_info() and get_all_schemas_secure()")
+    
+    supabase = _client()
+    
+    # The three lookups are independent, so run them concurrently
+    tables, schema, migrations = await asyncio.gather(
+        supabase.rpc('get_table_security_info').execute(),
+        _describe(None),
+        supabase.table('migrations').select('id', count='exact', head=True).execute(),
+        return_exceptions=True
+    )
+    
+    for result in (tables, schema):
+        if isinstance(result, APIError):
+            return _setup_required("get_table_security_info() and get_all_schemas_secure()")
+        if isinstance(result, Exception):
+            return {"error": f"Failed to describe database: {str(result)}"}
+    
+    tables = tables.data or []
+    return {
+        "tables": tables,
+        "table_count": len(tables),
+        "schema": list(schema),
+        # None when the migrations table has not been set up yet
+        "migration_count": None if isinstance(migrations, Exception) else migrations.count
+    }
+
+@mcp.tool()
+async def invalidate_schema_cache() -> Dict[str, Any]:
+    """Clear cached get_schema() results after schema changes made outside this server."""
+    cleared = len(_SCHEMA_CACHE)
+    _SCHEMA_CACHE.clear()
+    
+    log_operation("invalidate_schema_cache", {"cleared_entries": cleared})
+    
+    return {
+        "success": True,
+        "cleared_entries": cleared
+    }
 
 @mcp.tool()
-def clone_table_structure(source_table: str, target_table: str, admin_key: Optional[str] = None) -> Dict[str, Any]:
+async def clone_table_structure(source_table: str, target_table: str, admin_key: Optional[str] = None) -> Dict[str, Any]:
     """Clone table structure with authorization check."""
-    auth_check = check_authorization("clone_table_structure", {"admin_key": admin_key})
-    if not auth_check["authorized"]:
-        return {"error": auth_check["reason"]}
+    auth_error = check_authorization("clone_table_structure", admin_key)
+    if auth_error:
+        return {"error": auth_error}
     
     log_operation("clone_table_structure", {"source": source_table, "target": target_table})
     # ... existing implementation
 
 @mcp.tool()
-def generate_seed_data(table_name: str, num_rows: int = 10, admin_key: Optional[str] = None) -> Dict[str, Any]:
+async def generate_seed_data(table_name: str, num_rows: int = 10, admin_key: Optional[str] = None) -> Dict[str, Any]:
     """Generate seed data with authorization check."""
-    auth_check = check_authorization("generate_seed_data", {"admin_key": admin_key})
-    if not auth_check["authorized"]:
-        return {"error": auth_check["reason"]}
+    auth_error = check_authorization("generate_seed_data", admin_key)
+    if auth_error:
+        return {"error": auth_error}
     
     log_operation("generate_seed_data", {"table": table_name, "rows": num_rows})
     # ... existing implementation
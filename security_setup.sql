@@ -152,40 +152,53 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
--- Enhanced function to apply a migration with audit logging
-CREATE OR REPLACE FUNCTION apply_migration_by_id(migration_id_param INTEGER)
-RETURNS TEXT AS $$
+-- Apply a migration in a single call: lock the row, check its state, run up_sql,
+-- mark it applied and return the outcome as JSON
+DROP FUNCTION IF EXISTS apply_migration_by_id(INTEGER);
+CREATE OR REPLACE FUNCTION apply_migration_by_id(
+    migration_id_param INTEGER,
+    block_high_risk BOOLEAN DEFAULT FALSE,
+    applied_by_param TEXT DEFAULT NULL
+)
+RETURNS JSONB AS $$
 DECLARE
     migration_record RECORD;
-    result TEXT;
     start_time TIMESTAMPTZ;
     end_time TIMESTAMPTZ;
 BEGIN
-    start_time := NOW();
+    start_time := clock_timestamp();
     
-    -- Get the migration
-    SELECT * INTO migration_record FROM migrations WHERE id = migration_id_param;
+    -- Get and lock the migration so concurrent calls cannot apply it twice
+    SELECT * INTO migration_record FROM migrations WHERE id = migration_id_param FOR UPDATE;
     
     IF NOT FOUND THEN
-        RETURN 'Migration not found';
+        RETURN jsonb_build_object('status', 'not_found');
     END IF;
     
     IF migration_record.applied THEN
-        RETURN 'Migration already applied';
+        RETURN jsonb_build_object('status', 'already_applied', 'name', migration_record.name);
+    END IF;
+    
+    IF block_high_risk AND migration_record.security_analysis->>'risk_level' = 'HIGH' THEN
+        RETURN jsonb_build_object(
+            'status', 'high_risk',
+            'name', migration_record.name,
+            'warnings', COALESCE(migration_record.security_analysis->'warnings', '[]'::jsonb)
+        );
     END IF;
     
     BEGIN
         -- Execute the up_sql
         EXECUTE migration_record.up_sql;
         
-        end_time := NOW();
+        end_time := clock_timestamp();
         
         -- Mark as applied with audit information
         UPDATE migrations 
         SET 
             applied = TRUE, 
             applied_at = end_time,
-            applied_by = current_user
+            applied_by = COALESCE(applied_by_param, current_user)
         WHERE id = migration_id_param;
         
         -- Log the successful application
@@ -205,11 +218,15 @@ BEGIN
             end_time
         );
         
-        RETURN 'Migration applied successfully in ' || 
-               ROUND(EXTRACT(EPOCH FROM (end_time - start_time)) * 1000) || 'ms';
+        RETURN jsonb_build_object(
+            'status', 'applied',
+            'name', migration_record.name,
+            'applied_at', end_time,
+            'execution_time_ms', ROUND(EXTRACT(EPOCH FROM (end_time - start_time)) * 1000)
+        );
     EXCEPTION
         WHEN OTHERS THEN
-            end_time := NOW();
+            end_time := clock_timestamp();
             
             -- Log the failed application
             INSERT INTO migration_audit_log (
@@ -230,38 +247,42 @@ BEGIN
                 end_time
             );
             
-            RETURN 'Error applying migration: ' || SQLERRM;
+            RETURN jsonb_build_object('status', 'failed', 'name', migration_record.name, 'error', SQLERRM);
     END;
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
--- Enhanced function to rollback a migration with audit logging
-CREATE OR REPLACE FUNCTION rollback_migration_by_id(migration_id_param INTEGER)
-RETURNS TEXT AS $$
+-- Roll back a migration in a single call: lock the row, check its state, run down_sql,
+-- mark it rolled back and return the outcome as JSON
+DROP FUNCTION IF EXISTS rollback_migration_by_id(INTEGER);
+CREATE OR REPLACE FUNCTION rollback_migration_by_id(
+    migration_id_param INTEGER,
+    rolled_back_by_param TEXT DEFAULT NULL
+)
+RETURNS JSONB AS $$
 DECLARE
     migration_record RECORD;
-    result TEXT;
     start_time TIMESTAMPTZ;
     end_time TIMESTAMPTZ;
 BEGIN
-    start_time := NOW();
+    start_time := clock_timestamp();
     
-    -- Get the migration
-    SELECT * INTO migration_record FROM migrations WHERE id = migration_id_param;
+    -- Get and lock the migration so concurrent calls cannot roll it back twice
+    SELECT * INTO migration_record FROM migrations WHERE id = migration_id_param FOR UPDATE;
     
     IF NOT FOUND THEN
-        RETURN 'Migration not found';
+        RETURN jsonb_build_object('status', 'not_found');
     END IF;
     
     IF NOT migration_record.applied THEN
-        RETURN 'Migration not applied yet';
+        RETURN jsonb_build_object('status', 'not_applied', 'name', migration_record.name);
     END IF;
     
     BEGIN
         -- Execute the down_sql
         EXECUTE migration_record.down_sql;
         
-        end_time := NOW();
+        end_time := clock_timestamp();
         
         -- Mark as not applied
         UPDATE migrations 
@@ -269,7 +290,7 @@ BEGIN
             applied = FALSE, 
             applied_at = NULL,
             rolled_back_at = end_time,
-            rolled_back_by = current_user
+            rolled_back_by = COALESCE(rolled_back_by_param, current_user)
         WHERE id = migration_id_param;
         
         -- Log the successful rollback
@@ -289,11 +310,15 @@ BEGIN
             end_time
         );
         
-        RETURN 'Migration rolled back successfully in ' || 
-               ROUND(EXTRACT(EPOCH FROM (end_time - start_time)) * 1000) || 'ms';
+        RETURN jsonb_build_object(
+            'status', 'rolled_back',
+            'name', migration_record.name,
+            'rolled_back_at', end_time,
+            'execution_time_ms', ROUND(EXTRACT(EPOCH FROM (end_time - start_time)) * 1000)
+        );
     EXCEPTION
         WHEN OTHERS THEN
-            end_time := NOW();
+            end_time := clock_timestamp();
             
             -- Log the failed rollback
             INSERT INTO migration_audit_log (
@@ -314,7 +339,7 @@ BEGIN
                 end_time
             );
             
-            RETURN 'Error rolling back migration: ' || SQLERRM;
+            RETURN jsonb_build_object('status', 'failed', 'name', migration_record.name, 'error', SQLERRM);
     END;
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
@@ -392,8 +417,8 @@ GRANT EXECUTE ON FUNCTION check_rls_status() TO authenticated, service_role;
 GRANT EXECUTE ON FUNCTION get_table_security_info() TO authenticated, service_role;
 GRANT EXECUTE ON FUNCTION describe_table_secure(TEXT) TO authenticated, service_role;
 GRANT EXECUTE ON FUNCTION get_all_schemas_secure() TO authenticated, service_role;
-GRANT EXECUTE ON FUNCTION apply_migration_by_id(INTEGER) TO service_role;
-GRANT EXECUTE ON FUNCTION rollback_migration_by_id(INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION apply_migration_by_id(INTEGER, BOOLEAN, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION rollback_migration_by_id(INTEGER, TEXT) TO service_role;
 GRANT EXECUTE ON FUNCTION get_migration_audit(INTEGER) TO authenticated, service_role;
 
 -- Grant table permissions